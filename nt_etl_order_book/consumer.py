@@ -1,4 +1,5 @@
 import asyncio
+import os
 
 import polars as pl
 from postgres_client import PostgresClient
@@ -6,11 +7,27 @@ from redis_client import RedisClient
 
 
 class Consumer:
-    def __init__(self, batch_size: int = 100):
+    def __init__(self, batch_size: int = 100, shards: list[int] | None = None):
         self.redis_client = RedisClient()
         self.postgres_client = PostgresClient()
         self.batch_size = batch_size
 
+        # Consume all shards unless assigned a subset, e.g. CONSUMER_SHARDS=0,2
+        if shards is None and os.getenv("CONSUMER_SHARDS"):
+            shards = [int(shard) for shard in os.getenv("CONSUMER_SHARDS").split(",")]
+
+        if shards is None:
+            self.shards = list(range(self.redis_client.num_shards))
+        else:
+            self.shards = shards
+
+        for shard in self.shards:
+            if not 0 <= shard < self.redis_client.num_shards:
+                raise ValueError(
+                    f"shard must be in [0, {self.redis_client.num_shards}), "
+                    f"got {shard}"
+                )
+
     async def run(self):
         """
         Run the consumer: connect to Postgres, initialize schema,
@@ -20,27 +37,43 @@ class Consumer:
         self.postgres_client.initialize_schema()
         print("Database schema initialized")
 
-        # Process snapshots and deltas concurrently
+        snapshot_keys = [
+            self.redis_client.snapshot_stream_key(shard) for shard in self.shards
+        ]
+        delta_keys = [
+            self.redis_client.delta_stream_key(shard) for shard in self.shards
+        ]
+
+        # Backlog left in streams from a previous shard count is drained by
+        # the consumer owning shard 0
+        if 0 in self.shards:
+            snapshot_keys += await self.redis_client.get_stranded_stream_keys(
+                "snapshot"
+            )
+            delta_keys += await self.redis_client.get_stranded_stream_keys("delta")
+
+        # Process snapshots and deltas for each stream concurrently
         await asyncio.gather(
-            self._process_snapshots(),
-            self._process_deltas(),
+            *[self._process_snapshots(stream_key) for stream_key in snapshot_keys],
+            *[self._process_deltas(stream_key) for stream_key in delta_keys],
         )
 
-    async def _process_snapshots(self):
+    async def _process_snapshots(self, stream_key: str):
         """
-        Continuously process orderbook snapshots from Redis stream.
+        Continuously process orderbook snapshots from a Redis stream.
         Handles both existing messages (backlog) and new incoming messages.
         """
         start_id = "-"
         num_processed = 0
 
-        print("Starting snapshot processor")
+        print(f"Starting snapshot processor for {stream_key}")
         while True:
             records = []
+            message_records = []
             processed_ids = []
 
             messages = await self.redis_client.get_orderbook_snapshots(
-                count=self.batch_size, start_id=start_id
+                count=self.batch_size, start_id=start_id, stream_key=stream_key
             )
 
             # If no messages, wait and check again for new ones
@@ -51,6 +84,9 @@ class Consumer:
             for redis_stream_id, snapshot in messages:
                 timestamp = snapshot["ingestion_ts"]
                 ticker = snapshot["market_ticker"]
+                session_id = snapshot.get("session_id") or None
+                sid = snapshot["sid"]
+                seq = snapshot["seq"]
                 yes_dollars = snapshot["yes_dollars"]
                 no_dollars = snapshot["no_dollars"]
 
@@ -64,6 +100,9 @@ class Consumer:
                             "price_dollars": price_dollars,
                             "contracts": contracts,
                             "redis_stream_id": redis_stream_id,
+                            "session_id": session_id,
+                            "sid": sid,
+                            "seq": seq,
                         }
                     )
 
@@ -77,9 +116,25 @@ class Consumer:
                             "price_dollars": price_dollars,
                             "contracts": contracts,
                             "redis_stream_id": redis_stream_id,
+                            "session_id": session_id,
+                            "sid": sid,
+                            "seq": seq,
                         }
                     )
 
+                # One row per message, so snapshots of an empty book are kept
+                message_records.append(
+                    {
+                        "timestamp": timestamp,
+                        "ticker": ticker,
+                        "redis_stream_id": redis_stream_id,
+                        "session_id": session_id,
+                        "sid": sid,
+                        "seq": seq,
+                        "num_levels": len(yes_dollars) + len(no_dollars),
+                    }
+                )
+
                 processed_ids.append(redis_stream_id)
                 start_id = "(" + redis_stream_id
 
@@ -92,35 +147,56 @@ class Consumer:
                         "price_dollars": pl.Decimal(5, 4),
                         "contracts": pl.Int32,
                         "redis_stream_id": pl.String,
+                        "session_id": pl.String,
+                        "sid": pl.Int32,
+                        "seq": pl.Int64,
                     }
                 )
 
                 self.postgres_client.insert_orderbook_snapshots(records_df)
+
+            if len(message_records) > 0:
+                message_records_df = pl.DataFrame(message_records).cast(
+                    {
+                        "timestamp": pl.Int64,
+                        "ticker": pl.String,
+                        "redis_stream_id": pl.String,
+                        "session_id": pl.String,
+                        "sid": pl.Int32,
+                        "seq": pl.Int64,
+                        "num_levels": pl.Int32,
+                    }
+                )
+
+                self.postgres_client.insert_orderbook_snapshot_messages(
+                    message_records_df
+                )
                 num_processed += len(processed_ids)
                 print(
-                    f"Processed {len(processed_ids)} snapshots (total: {num_processed})"
+                    f"Processed {len(processed_ids)} snapshots from {stream_key} "
+                    f"(total: {num_processed})"
                 )
 
                 if processed_ids:
                     await self.redis_client.delete_messages(
-                        stream_key="orderbook:snapshot", message_ids=processed_ids
+                        stream_key=stream_key, message_ids=processed_ids
                     )
 
-    async def _process_deltas(self):
+    async def _process_deltas(self, stream_key: str):
         """
-        Continuously process orderbook deltas from Redis stream.
+        Continuously process orderbook deltas from a Redis stream.
         Handles both existing messages (backlog) and new incoming messages.
         """
         start_id = "-"
         num_processed = 0
 
-        print("Starting delta processor")
+        print(f"Starting delta processor for {stream_key}")
         while True:
             records = []
             processed_ids = []
 
             messages = await self.redis_client.get_orderbook_deltas(
-                count=self.batch_size, start_id=start_id
+                count=self.batch_size, start_id=start_id, stream_key=stream_key
             )
 
             # If no messages, wait and check again for new ones
@@ -134,6 +210,9 @@ class Consumer:
                 side = delta["side"]
                 price_dollars = delta["price_dollars"]
                 delta_value = delta["delta"]
+                session_id = delta.get("session_id") or None
+                sid = delta["sid"]
+                seq = delta["seq"]
 
                 records.append(
                     {
@@ -143,6 +222,22 @@ class Consumer:
                         "price_dollars": price_dollars,
                         "delta": delta_value,
                         "redis_stream_id": redis_stream_id,
+                        "session_id": session_id,
+                        "sid": sid,
+                        "seq": seq,
+                    }
+                )
+
+                # One row per message, so snapshots of an empty book are kept
+                message_records.append(
+                    {
+                        "timestamp": timestamp,
+                        "ticker": ticker,
+                        "redis_stream_id": redis_stream_id,
+                        "session_id": session_id,
+                        "sid": sid,
+                        "seq": seq,
+                        "num_levels": len(yes_dollars) + len(no_dollars),
                     }
                 )
 
@@ -158,14 +253,18 @@ class Consumer:
                         "price_dollars": pl.Decimal(5, 4),
                         "delta": pl.Int32,
                         "redis_stream_id": pl.String,
+                        "session_id": pl.String,
+                        "sid": pl.Int32,
+                        "seq": pl.Int64,
                     }
                 )
 
                 self.postgres_client.insert_orderbook_deltas(records_df)
                 num_processed += len(processed_ids)
-                print(f"Processed {len(processed_ids)} deltas (total: {num_processed})")
+                print(
+                    f"Processed {len(processed_ids)} deltas from {stream_key} "
+                    f"(total: {num_processed})"
+                )
 
                 if processed_ids:
-                    await self.redis_client.delete_messages(
-                        "orderbook:delta", processed_ids
-                    )
+                    await self.redis_client.delete_messages(stream_key, processed_ids)
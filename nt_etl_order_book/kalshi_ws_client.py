@@ -3,6 +3,7 @@ import csv
 import json
 import os
 import time
+import uuid
 
 import websockets
 from cryptography.hazmat.primitives import hashes, serialization
@@ -126,8 +127,10 @@ class KalshiWSClient:
             }
             await websocket.send(json.dumps(subscribe_msg))
 
-            # Initialize sequence tracking
+            # Initialize sequence tracking. sid and seq restart with every
+            # connection, so tag messages with an ID for this connection.
             expected_seq = 1
+            session_id = uuid.uuid4().hex
 
             # Check message for valid seq
             async for message in websocket:
@@ -145,4 +148,6 @@ class KalshiWSClient:
                     else:
                         expected_seq += 1
 
+                    data["session_id"] = session_id
+
                 yield data
@@ -0,0 +1,7 @@
+from postgres_client import PostgresClient
+
+if __name__ == "__main__":
+    # One-off: builds indexes on the existing tables without blocking inserts
+    postgres_client = PostgresClient()
+    postgres_client.initialize_schema()
+    postgres_client.create_indexes()
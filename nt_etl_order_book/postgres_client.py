@@ -4,6 +4,12 @@ import polars as pl
 import psycopg2
 from dotenv import load_dotenv
 
+ORDERBOOK_TABLES = [
+    "orderbook_snapshots",
+    "orderbook_snapshot_messages",
+    "orderbook_deltas",
+]
+
 
 class PostgresClient:
     def __init__(self, database_url: str | None = None):
@@ -32,7 +38,10 @@ class PostgresClient:
                     side VARCHAR(10) NOT NULL,
                     price_dollars DECIMAL(5, 4) NOT NULL,
                     contracts INTEGER NOT NULL,
-                    redis_stream_id VARCHAR(50) NOT NULL
+                    redis_stream_id VARCHAR(50) NOT NULL,
+                    session_id VARCHAR(32),
+                    sid INTEGER,
+                    seq BIGINT
                 )
             """
             )
@@ -44,12 +53,75 @@ class PostgresClient:
                     side VARCHAR(10) NOT NULL,
                     price_dollars DECIMAL(5, 4) NOT NULL,
                     delta INTEGER NOT NULL,
-                    redis_stream_id VARCHAR(50) NOT NULL
+                    redis_stream_id VARCHAR(50) NOT NULL,
+                    session_id VARCHAR(32),
+                    sid INTEGER,
+                    seq BIGINT
                 )
             """
             )
+            # One row per snapshot message, including snapshots of an empty
+            # book that store no rows in orderbook_snapshots
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS orderbook_snapshot_messages (
+                    timestamp BIGINT NOT NULL,
+                    ticker VARCHAR(50) NOT NULL,
+                    redis_stream_id VARCHAR(50) NOT NULL,
+                    session_id VARCHAR(32),
+                    sid INTEGER,
+                    seq BIGINT,
+                    num_levels INTEGER NOT NULL
+                )
+            """
+            )
+            for table in ["orderbook_snapshots", "orderbook_deltas"]:
+                # Tables created before session_id/sid/seq were recorded
+                # leave them null
+                cur.execute(
+                    f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS "
+                    "session_id VARCHAR(32)"
+                )
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS sid INTEGER")
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS seq BIGINT")
             self._conn.commit()
 
+    def create_indexes(self):
+        """
+        Create the indexes used by the validator's per-ticker and windowed
+        reads. Run once by migrate.py rather than on every start: indexes are
+        built CONCURRENTLY so inserts are not blocked, which cannot run inside
+        a transaction. An invalid index left by an interrupted build is
+        dropped and rebuilt.
+        """
+        self._conn.commit()
+        self._conn.autocommit = True
+        try:
+            with self._conn.cursor() as cur:
+                for table in ORDERBOOK_TABLES:
+                    for name, columns in [
+                        (f"{table}_ticker_timestamp_idx", "ticker, timestamp"),
+                        (f"{table}_timestamp_idx", "timestamp"),
+                    ]:
+                        cur.execute(
+                            """
+                            SELECT 1 FROM pg_index
+                            JOIN pg_class ON pg_class.oid = pg_index.indexrelid
+                            WHERE pg_class.relname = %s AND NOT pg_index.indisvalid
+                            """,
+                            (name,),
+                        )
+                        if cur.fetchone():
+                            cur.execute(f"DROP INDEX CONCURRENTLY {name}")
+
+                        print(f"Creating index {name}")
+                        cur.execute(
+                            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                            f"ON {table} ({columns})"
+                        )
+        finally:
+            self._conn.autocommit = False
+
     def insert_orderbook_snapshots(self, records_df: pl.DataFrame):
         records_df.write_database(
             table_name="orderbook_snapshots",
@@ -58,6 +130,14 @@ class PostgresClient:
             engine="adbc",
         )
 
+    def insert_orderbook_snapshot_messages(self, records_df: pl.DataFrame):
+        records_df.write_database(
+            table_name="orderbook_snapshot_messages",
+            connection=self._database_url,
+            if_table_exists="append",
+            engine="adbc",
+        )
+
     def insert_orderbook_deltas(self, records_df: pl.DataFrame):
         records_df.write_database(
             table_name="orderbook_deltas",
@@ -65,3 +145,150 @@ class PostgresClient:
             if_table_exists="append",
             engine="adbc",
         )
+
+    def _read_dataframe(self, query: str, params: tuple = ()) -> pl.DataFrame:
+        with self._conn.cursor() as cur:
+            cur.execute(query, params)
+            columns = [column[0] for column in cur.description]
+            rows = cur.fetchall()
+        return pl.DataFrame(rows, schema=columns, orient="row")
+
+    def get_tickers(self, start_ts: int | None = None) -> list[str]:
+        """Get every ticker with a stored snapshot, optionally from start_ts (ms)."""
+        with self._conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT DISTINCT ticker FROM orderbook_snapshots
+                WHERE timestamp >= %s
+                ORDER BY ticker
+                """,
+                (start_ts or 0,),
+            )
+            return [row[0] for row in cur.fetchall()]
+
+    def get_orderbook_snapshots(
+        self, ticker: str, start_ts: int | None = None
+    ) -> pl.DataFrame:
+        """Get snapshot rows for a ticker, optionally from start_ts (ms) onwards."""
+        return self._read_dataframe(
+            """
+            SELECT timestamp, ticker, side, price_dollars, contracts,
+                   redis_stream_id, session_id, sid, seq
+            FROM orderbook_snapshots
+            WHERE ticker = %s AND timestamp >= %s
+            """,
+            (ticker, start_ts or 0),
+        )
+
+    def get_orderbook_snapshot_messages(
+        self, ticker: str, start_ts: int | None = None
+    ) -> pl.DataFrame:
+        """Get snapshot message rows for a ticker, optionally from start_ts (ms)."""
+        return self._read_dataframe(
+            """
+            SELECT timestamp, ticker, redis_stream_id, session_id, sid, seq,
+                   num_levels
+            FROM orderbook_snapshot_messages
+            WHERE ticker = %s AND timestamp >= %s
+            """,
+            (ticker, start_ts or 0),
+        )
+
+    def get_latest_snapshot_ts(self, ticker: str, before_ts: int) -> int | None:
+        """
+        Get the ingestion time (ms) of the latest snapshot of a ticker at or
+        before before_ts, or None if there is none.
+        """
+        with self._conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT GREATEST(
+                    (SELECT MAX(timestamp) FROM orderbook_snapshots
+                     WHERE ticker = %s AND timestamp <= %s),
+                    (SELECT MAX(timestamp) FROM orderbook_snapshot_messages
+                     WHERE ticker = %s AND timestamp <= %s)
+                )
+                """,
+                (ticker, before_ts, ticker, before_ts),
+            )
+            return cur.fetchone()[0]
+
+    def get_orderbook_deltas(
+        self, ticker: str, start_ts: int | None = None
+    ) -> pl.DataFrame:
+        """Get delta rows for a ticker, optionally from start_ts (ms) onwards."""
+        return self._read_dataframe(
+            """
+            SELECT timestamp, ticker, side, price_dollars, delta,
+                   redis_stream_id, session_id, sid, seq
+            FROM orderbook_deltas
+            WHERE ticker = %s AND timestamp >= %s
+            """,
+            (ticker, start_ts or 0),
+        )
+
+    def get_seq_gaps(self, start_ts: int | None = None) -> pl.DataFrame:
+        """
+        Get gaps in the seq numbers of each (session_id, sid) across snapshots
+        and deltas, optionally from start_ts (ms) onwards. Rows without a
+        session_id are ignored. Snapshots of an empty book stored before
+        orderbook_snapshot_messages existed have no rows and show up as gaps.
+        """
+        return self._read_dataframe(
+            """
+            WITH messages AS (
+                (
+                    SELECT session_id, sid, seq FROM orderbook_snapshot_messages
+                    WHERE session_id IS NOT NULL AND timestamp >= %s
+                    UNION
+                    SELECT session_id, sid, seq FROM orderbook_snapshots
+                    WHERE session_id IS NOT NULL AND timestamp >= %s
+                )
+                UNION ALL
+                SELECT session_id, sid, seq FROM orderbook_deltas
+                WHERE session_id IS NOT NULL AND timestamp >= %s
+            )
+            SELECT session_id, sid, prev_seq, seq
+            FROM (
+                SELECT session_id, sid, seq,
+                       LAG(seq) OVER (
+                           PARTITION BY session_id, sid ORDER BY seq
+                       ) AS prev_seq
+                FROM messages
+            ) ordered
+            WHERE seq - prev_seq > 1
+            ORDER BY session_id, sid, seq
+            """,
+            (start_ts or 0, start_ts or 0, start_ts or 0),
+        )
+
+    def get_seq_duplicates(self, start_ts: int | None = None) -> pl.DataFrame:
+        """
+        Get (session_id, sid, seq) values stored by more than one message
+        across snapshots and deltas, optionally from start_ts (ms) onwards.
+        Rows without a session_id are ignored.
+        """
+        return self._read_dataframe(
+            """
+            WITH messages AS (
+                (
+                    SELECT session_id, sid, seq, redis_stream_id
+                    FROM orderbook_snapshot_messages
+                    WHERE session_id IS NOT NULL AND timestamp >= %s
+                    UNION
+                    SELECT session_id, sid, seq, redis_stream_id
+                    FROM orderbook_snapshots
+                    WHERE session_id IS NOT NULL AND timestamp >= %s
+                )
+                UNION ALL
+                SELECT session_id, sid, seq, redis_stream_id FROM orderbook_deltas
+                WHERE session_id IS NOT NULL AND timestamp >= %s
+            )
+            SELECT session_id, sid, seq, COUNT(*) AS count
+            FROM messages
+            GROUP BY session_id, sid, seq
+            HAVING COUNT(*) > 1
+            ORDER BY session_id, sid, seq
+            """,
+            (start_ts or 0, start_ts or 0, start_ts or 0),
+        )
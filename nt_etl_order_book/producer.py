@@ -1,53 +1,289 @@
 import asyncio
+import contextlib
+import time
 
+import redis.exceptions
 from kalshi_rest_client import KalshiRestClient
 from kalshi_ws_client import KalshiWSClient
 from redis_client import RedisClient
+from spill_log import SpillLog
+
+# Errors meaning Redis is unreachable or too slow, as opposed to a message
+# that can never be saved
+REDIS_UNAVAILABLE_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    redis.exceptions.ConnectionError,
+    redis.exceptions.TimeoutError,
+)
 
 
 class Producer:
-    def __init__(self):
+    def __init__(
+        self,
+        max_queue_size: int = 1000,
+        batch_size: int = 100,
+        redis_timeout: float = 1.0,
+    ):
         self.kalshi_rest_client = KalshiRestClient()
         self.kalshi_ws_client = KalshiWSClient()
         self.redis_client = RedisClient()
+        self.spill_log = SpillLog()
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.redis_timeout = redis_timeout
+
+        # Stream writes wait here for the single ordered writer
+        self._queue: asyncio.Queue[dict | None] = asyncio.Queue()
+        self._closing = False
+
+        # Authoritative current book per ticker, mirrored to the Redis cache
+        # by a background task
+        self._books: dict[str, dict] = {}
+        self._dirty_books: set[str] = set()
+        self._books_changed = asyncio.Event()
+
+    async def _with_timeout(self, coro):
+        """Await a Redis call, giving up after redis_timeout seconds."""
+        return await asyncio.wait_for(coro, self.redis_timeout)
+
+    def _apply_to_book(self, message: dict, ingestion_ts: int):
+        """Apply a message to the in-memory book and mark it for caching."""
+        msg: dict = message.get("msg", {})
+        market_ticker = msg.get("market_ticker")
+
+        if not market_ticker:
+            return
+
+        if message.get("type") == "orderbook_snapshot":
+            levels = {}
+            for side in ["yes", "no"]:
+                for price_dollars, contracts in msg.get(f"{side}_dollars", []):
+                    levels[(side, price_dollars)] = contracts
+            book = {"levels": levels}
+            self._books[market_ticker] = book
+
+        else:
+            # Deltas before the first snapshot have no book to apply to
+            book = self._books.get(market_ticker)
+            if book is None:
+                return
+
+            level = (msg.get("side"), msg.get("price_dollars"))
+            contracts = book["levels"].get(level, 0) + msg.get("delta", 0)
+            if contracts > 0:
+                book["levels"][level] = contracts
+            else:
+                book["levels"].pop(level, None)
+
+        book["seq"] = message.get("seq")
+        book["ingestion_ts"] = ingestion_ts
+        self._dirty_books.add(market_ticker)
+        self._books_changed.set()
+
+    def _cached_book(self, market_ticker: str) -> dict:
+        """Return an in-memory book in the format RedisClient caches."""
+        book = self._books[market_ticker]
+        cached_book = {
+            "market_ticker": market_ticker,
+            "seq": book["seq"],
+            "ingestion_ts": book["ingestion_ts"],
+            "yes_dollars": [],
+            "no_dollars": [],
+        }
+        for (side, price_dollars), contracts in book["levels"].items():
+            cached_book[f"{side}_dollars"].append([price_dollars, contracts])
+        return cached_book
 
-    async def _save_with_error_handling(self, coro):
-        """Helper to save to Redis with error handling."""
+    async def _write_cache(self):
+        """
+        Continuously mirror changed in-memory books to the Redis cache.
+
+        Each write replaces whole books, so changes made while a write is in
+        flight are coalesced into the next one and the WebSocket loop never
+        waits on Redis. Books that fail to write are retried, so the cache
+        catches up from memory once Redis recovers.
+        """
+        while True:
+            await self._books_changed.wait()
+            self._books_changed.clear()
+
+            market_tickers = list(self._dirty_books)
+            self._dirty_books.clear()
+            books = [self._cached_book(ticker) for ticker in market_tickers]
+
+            try:
+                await self._with_timeout(self.redis_client.cache_orderbooks(books))
+            except REDIS_UNAVAILABLE_ERRORS as e:
+                print(f"Error updating cached books, retrying: {e!r}")
+                self._dirty_books.update(market_tickers)
+                self._books_changed.set()
+                await asyncio.sleep(1)
+            except Exception as e:
+                # The next change to these books rewrites them in full
+                print(f"Error updating cached books for {market_tickers}: {e}")
+
+    def _spill(self, records: list[dict]):
+        """Append records to the local spill log for later replay."""
+        for record in records:
+            try:
+                if not self.spill_log.append(record):
+                    print(f"Spill log full, dropping {record['type']}: {record}")
+            except ValueError as e:
+                print(f"Error spilling {record['type']}, dropping it: {e}")
+
+    def _spill_queue(self):
+        """Move every queued record to the spill log, keeping their order."""
+        while not self._queue.empty():
+            record = self._queue.get_nowait()
+            if record is not None:
+                self._spill([record])
+
+    async def _write_records(self, records: list[dict]) -> int:
+        """
+        Write records to the Redis streams in order in a single round trip.
+        Records that can never be saved are logged and dropped.
+
+        A batch that times out may already have been applied by Redis.
+        Retrying it does not duplicate records with a session_id and seq,
+        which RedisClient skips once written; other records are delivered at
+        least once.
+
+        Returns:
+            Number of records written or dropped. Fewer than len(records)
+            means Redis became unavailable and the rest must be retried.
+        """
         try:
-            message_id = await coro
-            # print(f"Saved to Redis: {message_id}")
-        except Exception as e:
-            print(f"Error saving to Redis: {e}")
+            results = await self._with_timeout(
+                self.redis_client.save_orderbook_messages(
+                    [(record["message"], record["ingestion_ts"]) for record in records]
+                )
+            )
+        except REDIS_UNAVAILABLE_ERRORS as e:
+            print(f"Redis unavailable: {e!r}")
+            return 0
+        except Exception:
+            # A record failed before anything was sent, so write them one at
+            # a time to find and drop it
+            results = None
+
+        if results is not None:
+            for record, result in zip(records, results):
+                if isinstance(result, Exception):
+                    print(f"Dropping {record['type']} rejected by Redis: {result}")
+            return len(records)
+
+        for num_handled, record in enumerate(records):
+            try:
+                [result] = await self._with_timeout(
+                    self.redis_client.save_orderbook_messages(
+                        [(record["message"], record["ingestion_ts"])]
+                    )
+                )
+            except REDIS_UNAVAILABLE_ERRORS as e:
+                print(f"Redis unavailable: {e!r}")
+                return num_handled
+            except Exception as e:
+                result = e
+
+            if isinstance(result, Exception):
+                print(f"Dropping {record['type']} that cannot be saved: {result}")
+
+        return len(records)
+
+    async def _write_streams(self):
+        """
+        Single ordered writer for the Redis streams.
+
+        Queued records are written in batches. When Redis is unavailable, or
+        the queue grows past max_queue_size, records go to the spill log
+        instead; while it is non-empty every new record is spilled behind the
+        older ones and the log is replayed in batches, so stream order is
+        preserved. Runs until the producer is closing and the queue is empty.
+        """
+        while True:
+            if not self.spill_log.empty():
+                # Keep newer records behind the spilled ones
+                self._spill_queue()
+                if self._closing:
+                    return
+
+                records = self.spill_log.read(self.batch_size)
+                num_written = await self._write_records(records)
+                self.spill_log.pop(num_written)
+
+                # Back off while Redis is unavailable
+                if num_written < len(records):
+                    await asyncio.sleep(1)
+                continue
+
+            records = [await self._queue.get()]
+            while len(records) < self.batch_size and not self._queue.empty():
+                records.append(self._queue.get_nowait())
+            records = [record for record in records if record is not None]
+
+            # Redis is not keeping up, so spill instead of holding more in memory
+            if self._queue.qsize() >= self.max_queue_size:
+                print(f"Stream queue over {self.max_queue_size}, spilling to disk")
+                self._spill(records)
+                self._spill_queue()
+                continue
+
+            if records:
+                num_written = await self._write_records(records)
+                if num_written < len(records):
+                    self._spill(records[num_written:])
+                    self._spill_queue()
+
+            if self._closing and self._queue.empty():
+                return
 
     async def run(self, series_ticker: str) -> None:
         market_tickers = self.kalshi_rest_client.get_tickers(
             series_ticker=series_ticker
         )
 
+        writer = asyncio.create_task(self._write_streams())
+        cache_writer = asyncio.create_task(self._write_cache())
+
         try:
             async for message in self.kalshi_ws_client.get_order_book_messages(
                 market_tickers=market_tickers
             ):
+                ingestion_ts = int(time.time() * 1000)
                 msg_type = message.get("type")
 
-                # Save to Redis based on message type
-                if msg_type == "orderbook_snapshot":
-                    asyncio.create_task(
-                        self._save_with_error_handling(
-                            self.redis_client.save_orderbook_snapshot(message)
-                        )
-                    )
-
-                elif msg_type == "orderbook_delta":
-                    asyncio.create_task(
-                        self._save_with_error_handling(
-                            self.redis_client.save_orderbook_delta(message)
-                        )
-                    )
-
-                else:
+                if msg_type not in ["orderbook_snapshot", "orderbook_delta"]:
                     # For other message types (like 'subscribed', 'error'), just print
                     print(f"Received {msg_type}: {message}")
+                    continue
+
+                # Nothing here awaits Redis: the cache and the streams are
+                # written by background tasks
+                self._apply_to_book(message, ingestion_ts)
+                self._queue.put_nowait(
+                    {
+                        "type": msg_type,
+                        "message": message,
+                        "ingestion_ts": ingestion_ts,
+                    }
+                )
+
+                if writer.done():
+                    # Surface the writer's error instead of queueing forever
+                    writer.result()
         finally:
-            # Clean up Redis connection
-            await self.redis_client.close()
+            cache_writer.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await cache_writer
+
+            # Let the writer write or spill everything queued before closing
+            self._closing = True
+            self._queue.put_nowait(None)
+            try:
+                await writer
+            finally:
+                self.spill_log.close()
+
+                # Clean up Redis connection
+                await self.redis_client.close()
@@ -1,40 +1,145 @@
 import json
 import os
 import time
+import zlib
 
 import redis.asyncio
 from dotenv import load_dotenv
 
+# Replace the cached book for a ticker with a full book and notify subscribers.
+# KEYS[1]: book key
+# ARGV: channel, notification, seq, ingestion_ts, then field/contracts pairs
+CACHE_SNAPSHOT_SCRIPT = """
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'seq', ARGV[3], 'ingestion_ts', ARGV[4])
+for i = 5, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('PUBLISH', ARGV[1], ARGV[2])
+return 1
+"""
+
+# Add a message to its stream unless its seq was already written for the
+# same connection and subscription, e.g. by a batch that timed out after
+# Redis applied it. Returns the message ID, or nil for a duplicate.
+# KEYS[1]: stream key, KEYS[2]: last written seq key
+# ARGV: seq, seq key TTL in seconds, then field/value pairs
+SAVE_MESSAGE_SCRIPT = """
+local last_seq = redis.call('GET', KEYS[2])
+if last_seq and tonumber(last_seq) >= tonumber(ARGV[1]) then
+    return false
+end
+local message_id = redis.call('XADD', KEYS[1], '*', unpack(ARGV, 3))
+redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[2])
+return message_id
+"""
+
+# How long the last written seq of a connection is kept after its last write
+SEQ_KEY_TTL_SECONDS = 24 * 60 * 60
+
 
 class RedisClient:
-    def __init__(self, redis_url: str | None = None):
+    """
+    Redis access for the orderbook streams and the cached current books.
+
+    Snapshots and deltas are hash-sharded by market ticker across num_shards
+    streams per type (REDIS_NUM_SHARDS, default 1). A single shard uses the
+    unsharded keys orderbook:snapshot and orderbook:delta. Shards let several
+    consumers read in parallel; the client itself connects to a single node.
+
+    Changing num_shards remaps tickers to new stream keys. Backlog left in
+    keys outside the new layout is listed by get_stranded_stream_keys and
+    drained by the consumer owning shard 0, concurrently with the new shards.
+    """
+
+    def __init__(self, redis_url: str | None = None, num_shards: int | None = None):
         load_dotenv(override=True)
 
         if redis_url is None:
             self._redis_url = os.getenv("REDIS_URL")
 
+        if num_shards is None:
+            self.num_shards = int(os.getenv("REDIS_NUM_SHARDS", "1"))
+        else:
+            self.num_shards = num_shards
+
+        if self.num_shards < 1:
+            raise ValueError("num_shards must be at least 1")
+
         self._client = redis.asyncio.from_url(self._redis_url)
+        self._cache_snapshot_script = self._client.register_script(
+            CACHE_SNAPSHOT_SCRIPT
+        )
+        self._save_message_script = self._client.register_script(
+            SAVE_MESSAGE_SCRIPT
+        )
 
-    async def save_orderbook_snapshot(self, message: dict) -> str:
-        """
-        Save an orderbook snapshot to a Redis stream.
+    def shard_for(self, market_ticker: str) -> int:
+        """Return the stream shard a market ticker is assigned to."""
+        # crc32 is stable across processes, unlike the builtin hash()
+        return zlib.crc32(market_ticker.encode("utf-8")) % self.num_shards
 
-        Stream key format: orderbook:snapshot (consolidated stream)
+    def _stream_key(self, stream: str, shard: int) -> str:
+        if not 0 <= shard < self.num_shards:
+            raise ValueError(f"shard must be in [0, {self.num_shards}), got {shard}")
 
-        Returns the message ID from Redis.
+        # A single shard keeps the original unsharded key
+        if self.num_shards == 1:
+            return f"orderbook:{stream}"
+        return f"orderbook:{stream}:{shard}"
+
+    def snapshot_stream_key(self, shard: int = 0) -> str:
+        """Return the snapshot stream key for a shard."""
+        return self._stream_key("snapshot", shard)
+
+    def delta_stream_key(self, shard: int = 0) -> str:
+        """Return the delta stream key for a shard."""
+        return self._stream_key("delta", shard)
+
+    async def get_stranded_stream_keys(self, stream: str) -> list[str]:
         """
+        Get existing stream keys that are not part of the current shard layout,
+        e.g. left over from a different REDIS_NUM_SHARDS.
+
+        Args:
+            stream: "snapshot" or "delta"
+        """
+        current_keys = {
+            self._stream_key(stream, shard) for shard in range(self.num_shards)
+        }
+
+        stranded_keys = []
+        for pattern in [f"orderbook:{stream}", f"orderbook:{stream}:*"]:
+            async for key in self._client.scan_iter(match=pattern, _type="stream"):
+                key = key.decode("utf-8") if isinstance(key, bytes) else key
+                if key not in current_keys:
+                    stranded_keys.append(key)
+
+        return sorted(stranded_keys)
+
+    @staticmethod
+    def _book_key(market_ticker: str) -> str:
+        return f"orderbook:book:{market_ticker}"
+
+    @staticmethod
+    def _seq_key(session_id: str, sid: int) -> str:
+        return f"orderbook:seq:{session_id}:{sid}"
+
+    def _snapshot_entry(self, message: dict, ingestion_ts: int) -> tuple[str, dict]:
+        """Build the stream key and fields for an orderbook snapshot."""
         msg: dict = message.get("msg", {})
         market_ticker = msg.get("market_ticker")
 
         if not market_ticker:
             raise ValueError("market_ticker not found in message")
 
-        stream_key = "orderbook:snapshot"
+        stream_key = self.snapshot_stream_key(self.shard_for(market_ticker))
 
         # Prepare data for Redis stream
         # Store numeric values as-is, only stringify what's necessary
         data = {
             "type": message.get("type"),
+            "session_id": message.get("session_id", ""),
             "sid": message.get("sid"),
             "seq": message.get("seq"),
             "market_ticker": market_ticker,
@@ -43,35 +148,25 @@ class RedisClient:
             "no_dollars": json.dumps(msg.get("no_dollars", [])),
             "yes": json.dumps(msg.get("yes", [])),
             "no": json.dumps(msg.get("no", [])),
-            "ingestion_ts": int(time.time() * 1000),
+            "ingestion_ts": ingestion_ts,
         }
+        return stream_key, data
 
-        # Add to Redis stream
-        message_id = await self._client.xadd(stream_key, data)
-        return (
-            message_id.decode("utf-8") if isinstance(message_id, bytes) else message_id
-        )
-
-    async def save_orderbook_delta(self, message: dict) -> str:
-        """
-        Save an orderbook delta to a Redis stream.
-
-        Stream key format: orderbook:delta (consolidated stream)
-
-        Returns the message ID from Redis.
-        """
+    def _delta_entry(self, message: dict, ingestion_ts: int) -> tuple[str, dict]:
+        """Build the stream key and fields for an orderbook delta."""
         msg: dict = message.get("msg", {})
         market_ticker = msg.get("market_ticker")
 
         if not market_ticker:
             raise ValueError("market_ticker not found in message")
 
-        stream_key = "orderbook:delta"
+        stream_key = self.delta_stream_key(self.shard_for(market_ticker))
 
         # Prepare data for Redis stream
         # Store numeric values as-is, only stringify what's necessary
         data = {
             "type": message.get("type"),
+            "session_id": message.get("session_id", ""),
             "sid": message.get("sid"),
             "seq": message.get("seq"),
             "market_ticker": market_ticker,
@@ -81,8 +176,21 @@ class RedisClient:
             "delta": msg.get("delta"),
             "side": msg.get("side"),
             "ts": msg.get("ts"),
-            "ingestion_ts": int(time.time() * 1000),
+            "ingestion_ts": ingestion_ts,
         }
+        return stream_key, data
+
+    async def save_orderbook_snapshot(self, message: dict) -> str:
+        """
+        Save an orderbook snapshot to a Redis stream.
+
+        Stream key format: orderbook:snapshot:{shard}, where the shard is
+        derived from market_ticker (orderbook:snapshot when num_shards is 1)
+
+        Returns the message ID from Redis.
+        """
+        ingestion_ts = int(time.time() * 1000)
+        stream_key, data = self._snapshot_entry(message, ingestion_ts)
 
         # Add to Redis stream
         message_id = await self._client.xadd(stream_key, data)
@@ -90,22 +198,98 @@ class RedisClient:
             message_id.decode("utf-8") if isinstance(message_id, bytes) else message_id
         )
 
+    async def save_orderbook_delta(self, message: dict) -> str:
+        """
+        Save an orderbook delta to a Redis stream.
+
+        Stream key format: orderbook:delta:{shard}, where the shard is
+        derived from market_ticker (orderbook:delta when num_shards is 1)
+
+        Returns the message ID from Redis.
+        """
+        ingestion_ts = int(time.time() * 1000)
+        stream_key, data = self._delta_entry(message, ingestion_ts)
+
+        # Add to Redis stream
+        message_id = await self._client.xadd(stream_key, data)
+        return (
+            message_id.decode("utf-8") if isinstance(message_id, bytes) else message_id
+        )
+
+    async def save_orderbook_messages(
+        self, messages: list[tuple[dict, int]]
+    ) -> list[str | Exception]:
+        """
+        Save orderbook snapshots and deltas to their Redis streams in order,
+        in a single round trip.
+
+        Messages with a session_id and seq are skipped if a seq at least as
+        high was already written for their connection and subscription, so
+        retrying a batch that Redis applied before timing out does not
+        duplicate it. Messages without them, or retried after
+        SEQ_KEY_TTL_SECONDS, are delivered at least once.
+
+        Args:
+            messages: List of (message, ingestion_ts) tuples, dispatched on
+                the message type
+
+        Returns:
+            List with the message ID from Redis for each message, None for a
+            skipped duplicate, or the error Redis returned for it. Connection
+            errors are raised.
+        """
+        async with self._client.pipeline(transaction=False) as pipe:
+            for message, ingestion_ts in messages:
+                if message.get("type") == "orderbook_snapshot":
+                    stream_key, data = self._snapshot_entry(message, ingestion_ts)
+                else:
+                    stream_key, data = self._delta_entry(message, ingestion_ts)
+
+                if not data["session_id"] or data["sid"] is None or data["seq"] is None:
+                    pipe.xadd(stream_key, data)
+                    continue
+
+                args = [data["seq"], SEQ_KEY_TTL_SECONDS]
+                for field, value in data.items():
+                    args.extend([field, value])
+
+                await self._save_message_script(
+                    keys=[stream_key, self._seq_key(data["session_id"], data["sid"])],
+                    args=args,
+                    client=pipe,
+                )
+            results = await pipe.execute(raise_on_error=False)
+
+        return [
+            result.decode("utf-8") if isinstance(result, bytes) else result
+            for result in results
+        ]
+
     async def get_orderbook_snapshots(
-        self, count: int = 10, start_id: str = "-", end_id: str = "+"
+        self,
+        count: int = 10,
+        start_id: str = "-",
+        end_id: str = "+",
+        shard: int = 0,
+        stream_key: str | None = None,
     ) -> list[tuple[str, dict]]:
         """
-        Get orderbook snapshots from the Redis stream.
+        Get orderbook snapshots from a Redis stream shard.
 
         Args:
             count: Maximum number of snapshots to retrieve (default: 10)
             start_id: Starting message ID (default: "-" for beginning of stream)
             end_id: Ending message ID (default: "+" for end of stream)
+            shard: Stream shard to read from (default: 0)
+            stream_key: Stream key to read from instead of the shard's, e.g.
+                one from get_stranded_stream_keys
 
         Returns:
             List of tuples containing (message_id, data_dict) where data_dict
             contains the snapshot fields with JSON fields parsed back into objects.
         """
-        stream_key = "orderbook:snapshot"
+        if stream_key is None:
+            stream_key = self.snapshot_stream_key(shard)
 
         # Read from the stream
         messages = await self._client.xrange(stream_key, start_id, end_id, count)
@@ -137,21 +321,30 @@ class RedisClient:
         return results
 
     async def get_orderbook_deltas(
-        self, count: int = 10, start_id: str = "-", end_id: str = "+"
+        self,
+        count: int = 10,
+        start_id: str = "-",
+        end_id: str = "+",
+        shard: int = 0,
+        stream_key: str | None = None,
     ) -> list[tuple[str, dict]]:
         """
-        Get orderbook deltas from the Redis stream.
+        Get orderbook deltas from a Redis stream shard.
 
         Args:
             count: Maximum number of deltas to retrieve (default: 10)
             start_id: Starting message ID (default: "-" for beginning of stream)
             end_id: Ending message ID (default: "+" for end of stream)
+            shard: Stream shard to read from (default: 0)
+            stream_key: Stream key to read from instead of the shard's, e.g.
+                one from get_stranded_stream_keys
 
         Returns:
             List of tuples containing (message_id, data_dict) where data_dict
             contains the delta fields (price, delta, side, etc.).
         """
-        stream_key = "orderbook:delta"
+        if stream_key is None:
+            stream_key = self.delta_stream_key(shard)
 
         # Read from the stream
         messages = await self._client.xrange(stream_key, start_id, end_id, count)
@@ -182,7 +375,8 @@ class RedisClient:
         Delete multiple messages from a Redis stream in a single command.
 
         Args:
-            stream_key: The Redis stream key
+            stream_key: The Redis stream key (see snapshot_stream_key and
+                delta_stream_key)
             message_ids: List of message IDs to delete
 
         Returns:
@@ -192,6 +386,130 @@ class RedisClient:
             return 0
         return await self._client.xdel(stream_key, *message_ids)
 
+    async def cache_orderbooks(self, books: list[dict]) -> None:
+        """
+        Replace the cached current books for several markets in a single
+        round trip.
+
+        Book key format: orderbook:book:{market_ticker} (hash of
+        "{side}:{price_dollars}" -> contracts, plus seq and ingestion_ts)
+
+        Each book is replaced and a notification is published on the
+        orderbook:updates channel in a single atomic script.
+
+        Args:
+            books: Dicts in the format returned by get_orderbook
+        """
+        if not books:
+            return
+
+        async with self._client.pipeline(transaction=False) as pipe:
+            for book in books:
+                notification = json.dumps(
+                    {
+                        "market_ticker": book["market_ticker"],
+                        "seq": book["seq"],
+                        "ingestion_ts": book["ingestion_ts"],
+                    }
+                )
+
+                args = [
+                    "orderbook:updates",
+                    notification,
+                    book["seq"],
+                    book["ingestion_ts"],
+                ]
+                for side in ["yes", "no"]:
+                    for price_dollars, contracts in book[f"{side}_dollars"]:
+                        args.extend([f"{side}:{price_dollars}", contracts])
+
+                await self._cache_snapshot_script(
+                    keys=[self._book_key(book["market_ticker"])],
+                    args=args,
+                    client=pipe,
+                )
+            await pipe.execute()
+
+    @staticmethod
+    def _parse_book(market_ticker: str, data: dict) -> dict | None:
+        """Parse a cached book hash into the snapshot-style dict."""
+        if not data:
+            return None
+
+        book = {
+            "market_ticker": market_ticker,
+            "seq": None,
+            "ingestion_ts": None,
+            "yes_dollars": [],
+            "no_dollars": [],
+        }
+        for key, value in data.items():
+            key = key.decode("utf-8") if isinstance(key, bytes) else key
+            value = value.decode("utf-8") if isinstance(value, bytes) else value
+
+            if key in ["seq", "ingestion_ts"]:
+                book[key] = int(value)
+            else:
+                side, price_dollars = key.split(":", 1)
+                book[f"{side}_dollars"].append([price_dollars, int(value)])
+
+        book["yes_dollars"].sort(key=lambda level: float(level[0]))
+        book["no_dollars"].sort(key=lambda level: float(level[0]))
+        return book
+
+    async def get_orderbook(self, market_ticker: str) -> dict | None:
+        """
+        Get the cached current book for a market.
+
+        Returns:
+            Dict with market_ticker, seq, ingestion_ts, yes_dollars and
+            no_dollars ([price_dollars, contracts] pairs sorted by price),
+            or None if no book is cached for the market.
+        """
+        data = await self._client.hgetall(self._book_key(market_ticker))
+        return self._parse_book(market_ticker, data)
+
+    async def get_orderbooks(self, market_tickers: list[str]) -> dict[str, dict | None]:
+        """
+        Get the cached current books for several markets in a single round trip.
+
+        Returns:
+            Dict mapping each market ticker to its book (see get_orderbook),
+            or None if no book is cached for that market.
+        """
+        if not market_tickers:
+            return {}
+
+        async with self._client.pipeline(transaction=False) as pipe:
+            for market_ticker in market_tickers:
+                pipe.hgetall(self._book_key(market_ticker))
+            results = await pipe.execute()
+
+        return {
+            market_ticker: self._parse_book(market_ticker, data)
+            for market_ticker, data in zip(market_tickers, results)
+        }
+
+    async def listen_orderbook_updates(self):
+        """
+        Subscribe to book change notifications.
+
+        Yields a dict (market_ticker, seq, ingestion_ts) each time a cached
+        book is updated. Updates that arrive while a book is being written
+        are coalesced, so seq can advance by more than one.
+        """
+        pubsub = self._client.pubsub()
+        await pubsub.subscribe("orderbook:updates")
+
+        try:
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                yield json.loads(message["data"])
+        finally:
+            await pubsub.unsubscribe("orderbook:updates")
+            await pubsub.close()
+
     async def close(self):
         """Close the Redis connection."""
         await self._client.close()
@@ -0,0 +1,239 @@
+import json
+import mmap
+import os
+import struct
+
+from dotenv import load_dotenv
+
+# Segment header: offset of the next record to replay
+SEGMENT_HEADER = struct.Struct("<Q")
+# Record header: payload length (a zero length marks the end of written data)
+RECORD_HEADER = struct.Struct("<I")
+
+
+class SpillLog:
+    """
+    Append-only, memory-mapped segment log on local disk.
+
+    Records are JSON-encoded dicts stored as length-prefixed payloads in
+    preallocated segment files. The writer appends to the newest segment and
+    rotates when it is full; the reader replays from the oldest segment and
+    deletes segments once they have been fully replayed. The replay offset is
+    stored in each segment header, so pending records survive a restart.
+    """
+
+    def __init__(
+        self,
+        directory: str | None = None,
+        segment_bytes: int | None = None,
+        max_bytes: int | None = None,
+    ):
+        load_dotenv(override=True)
+
+        if directory is None:
+            self._directory = os.getenv("SPILL_LOG_DIR", "spill_log")
+        else:
+            self._directory = directory
+
+        if segment_bytes is None:
+            self._segment_bytes = int(
+                os.getenv("SPILL_LOG_SEGMENT_BYTES", str(64 * 1024 * 1024))
+            )
+        else:
+            self._segment_bytes = segment_bytes
+
+        if max_bytes is None:
+            self._max_bytes = int(
+                os.getenv("SPILL_LOG_MAX_BYTES", str(1024 * 1024 * 1024))
+            )
+        else:
+            self._max_bytes = max_bytes
+
+        if self._max_bytes < self._segment_bytes:
+            raise ValueError("max_bytes must be at least segment_bytes")
+
+        os.makedirs(self._directory, exist_ok=True)
+
+        # Segment indices on disk, oldest first
+        self._segments = sorted(
+            int(name.removesuffix(".seg"))
+            for name in os.listdir(self._directory)
+            if name.endswith(".seg")
+        )
+
+        self._read_mm: mmap.mmap | None = None
+        self._read_offset = SEGMENT_HEADER.size
+        self._write_mm: mmap.mmap | None = None
+        self._write_offset = SEGMENT_HEADER.size
+        self._closed = False
+
+        # Resume from segments left over by a previous run
+        if self._segments:
+            self._open_read_segment()
+            if len(self._segments) == 1:
+                self._write_mm = self._read_mm
+            else:
+                self._write_mm = self._open_segment(self._segments[-1])
+            self._write_offset = self._scan_end(self._write_mm)
+
+    def _segment_path(self, index: int) -> str:
+        return os.path.join(self._directory, f"{index:020d}.seg")
+
+    def _open_segment(self, index: int, create: bool = False) -> mmap.mmap:
+        path = self._segment_path(index)
+
+        if create:
+            with open(path, "wb") as file:
+                file.truncate(self._segment_bytes)
+
+        # The mmap keeps its own handle, so the file can be closed right away
+        with open(path, "r+b") as file:
+            mm = mmap.mmap(file.fileno(), 0)
+
+        if create:
+            SEGMENT_HEADER.pack_into(mm, 0, SEGMENT_HEADER.size)
+        return mm
+
+    def _open_read_segment(self):
+        """Open the oldest segment for replay and restore its replay offset."""
+        if len(self._segments) == 1 and self._write_mm is not None:
+            self._read_mm = self._write_mm
+        else:
+            self._read_mm = self._open_segment(self._segments[0])
+
+        (offset,) = SEGMENT_HEADER.unpack_from(self._read_mm, 0)
+        self._read_offset = max(offset, SEGMENT_HEADER.size)
+
+    @staticmethod
+    def _scan_end(mm: mmap.mmap) -> int:
+        """Return the offset just past the last record written to a segment."""
+        offset = SEGMENT_HEADER.size
+        while offset + RECORD_HEADER.size <= len(mm):
+            (length,) = RECORD_HEADER.unpack_from(mm, offset)
+            if length == 0:
+                break
+            offset += RECORD_HEADER.size + length
+        return offset
+
+    def _rotate(self):
+        """Start a new write segment."""
+        index = self._segments[-1] + 1 if self._segments else 0
+
+        # Keep the old write segment mapped if it is still being replayed
+        if self._write_mm is not None and self._write_mm is not self._read_mm:
+            self._write_mm.flush()
+            self._write_mm.close()
+
+        self._write_mm = self._open_segment(index, create=True)
+        self._write_offset = SEGMENT_HEADER.size
+        self._segments.append(index)
+
+        if self._read_mm is None:
+            self._read_mm = self._write_mm
+            self._read_offset = SEGMENT_HEADER.size
+
+    def _retire_read_segment(self):
+        """Delete the fully replayed oldest segment and move on to the next."""
+        self._read_mm.close()
+        os.remove(self._segment_path(self._segments.pop(0)))
+        self._open_read_segment()
+
+    def _next_length(self) -> int:
+        """
+        Return the payload length of the next record to replay, or 0 if the
+        reader has caught up with the writer.
+        """
+        while self._read_mm is not None:
+            if self._read_offset + RECORD_HEADER.size <= len(self._read_mm):
+                (length,) = RECORD_HEADER.unpack_from(self._read_mm, self._read_offset)
+                if length:
+                    return length
+
+            # Reached the end of the read segment
+            if self._read_mm is self._write_mm:
+                return 0
+            self._retire_read_segment()
+
+        return 0
+
+    def append(self, record: dict) -> bool:
+        """
+        Append a record to the log.
+
+        Returns:
+            True if the record was written, False if the disk budget is
+            exhausted and the record was dropped.
+        """
+        if self._closed:
+            raise ValueError("Cannot append to a closed spill log")
+
+        payload = json.dumps(record).encode("utf-8")
+        size = RECORD_HEADER.size + len(payload)
+
+        if SEGMENT_HEADER.size + size > self._segment_bytes:
+            raise ValueError(
+                f"Record of {size} bytes does not fit in a "
+                f"{self._segment_bytes} byte segment"
+            )
+
+        if self._write_mm is None or self._write_offset + size > len(self._write_mm):
+            if (len(self._segments) + 1) * self._segment_bytes > self._max_bytes:
+                return False
+            self._rotate()
+
+        # Write the payload before its length so a torn write is never replayed
+        offset = self._write_offset
+        self._write_mm[offset + RECORD_HEADER.size : offset + size] = payload
+        RECORD_HEADER.pack_into(self._write_mm, offset, len(payload))
+        self._write_offset += size
+        return True
+
+    def read(self, count: int = 1) -> list[dict]:
+        """
+        Return up to count of the oldest records not yet replayed, without
+        marking them as replayed. A batch never spans two segments.
+        """
+        records = []
+        if not self._next_length():
+            return records
+
+        offset = self._read_offset
+        while len(records) < count:
+            if offset + RECORD_HEADER.size > len(self._read_mm):
+                break
+
+            (length,) = RECORD_HEADER.unpack_from(self._read_mm, offset)
+            if length == 0:
+                break
+
+            start = offset + RECORD_HEADER.size
+            records.append(json.loads(self._read_mm[start : start + length]))
+            offset = start + length
+
+        return records
+
+    def pop(self, count: int = 1):
+        """Mark the count oldest records as replayed."""
+        for _ in range(count):
+            length = self._next_length()
+            if not length:
+                return
+
+            self._read_offset += RECORD_HEADER.size + length
+            SEGMENT_HEADER.pack_into(self._read_mm, 0, self._read_offset)
+
+    def empty(self) -> bool:
+        """Return True if every record has been replayed."""
+        return self._next_length() == 0
+
+    def close(self):
+        """Flush and unmap the open segments."""
+        if self._read_mm is not None and self._read_mm is not self._write_mm:
+            self._read_mm.flush()
+            self._read_mm.close()
+        if self._write_mm is not None:
+            self._write_mm.flush()
+            self._write_mm.close()
+        self._read_mm = None
+        self._write_mm = None
+        self._closed = True
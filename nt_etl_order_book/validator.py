@@ -0,0 +1,342 @@
+import argparse
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import polars as pl
+from postgres_client import PostgresClient
+from tqdm import tqdm
+
+ISSUE_TYPES = ["divergences", "negative_contracts", "duplicate_stream_ids"]
+
+# Postgres client for each worker process, created by _init_worker
+_postgres_client: PostgresClient | None = None
+
+
+def _init_worker():
+    global _postgres_client
+    _postgres_client = PostgresClient()
+
+
+def _check_ticker_worker(ticker: str, start_ts: int | None) -> dict[str, list[dict]]:
+    # Replay from the latest snapshot before the window so the first deltas
+    # in it apply to a known book
+    load_ts = start_ts
+    if start_ts is not None:
+        load_ts = _postgres_client.get_latest_snapshot_ts(ticker, start_ts)
+        if load_ts is None:
+            load_ts = start_ts
+
+    snapshots = _postgres_client.get_orderbook_snapshots(ticker, load_ts)
+    snapshot_messages = _postgres_client.get_orderbook_snapshot_messages(
+        ticker, load_ts
+    )
+    deltas = _postgres_client.get_orderbook_deltas(ticker, load_ts)
+    return check_ticker(ticker, snapshots, deltas, snapshot_messages, start_ts)
+
+
+def _order_key(timestamp: int, seq: int | None, redis_stream_id: str) -> tuple:
+    """Order messages by ingestion time, then seq, then Redis stream ID."""
+    stream_ms, stream_seq = (int(part) for part in redis_stream_id.split("-"))
+    return (timestamp, seq if seq is not None else 0, stream_ms, stream_seq)
+
+
+def check_ticker(
+    ticker: str,
+    snapshots: pl.DataFrame,
+    deltas: pl.DataFrame,
+    snapshot_messages: pl.DataFrame | None = None,
+    start_ts: int | None = None,
+) -> dict[str, list[dict]]:
+    """
+    Check the stored snapshots and deltas of a single ticker.
+
+    Replays deltas on top of each snapshot and compares the result with the
+    next snapshot of the same WebSocket session. The book is reset when the
+    session changes, and deltas before the first snapshot of a session are
+    skipped since the book they apply to is unknown.
+
+    Args:
+        ticker: Ticker being checked
+        snapshots: Snapshot rows, one per price level
+        deltas: Delta rows, one per message
+        snapshot_messages: Snapshot message rows, used to replay snapshots of
+            an empty book, which store no rows in snapshots
+        start_ts: Only report issues from this ingestion time (ms) onwards;
+            earlier rows are only replayed
+
+    Returns:
+        Dict mapping each issue type in ISSUE_TYPES to a list of issue rows.
+    """
+    issues = {issue_type: [] for issue_type in ISSUE_TYPES}
+
+    if snapshots.is_empty() and deltas.is_empty():
+        if snapshot_messages is None or snapshot_messages.is_empty():
+            return issues
+
+    def in_window(timestamp: int) -> bool:
+        return start_ts is None or timestamp >= start_ts
+
+    # Snapshots store one row per price level, deltas one row per message
+    if not snapshots.is_empty():
+        # A snapshot inserted n times repeats each of its levels n times
+        duplicates = (
+            snapshots.filter(pl.col("timestamp") >= (start_ts or 0))
+            .group_by(["redis_stream_id", "side", "price_dollars"])
+            .len()
+            .group_by("redis_stream_id")
+            .agg(pl.col("len").max())
+            .filter(pl.col("len") > 1)
+        )
+        for row in duplicates.iter_rows(named=True):
+            issues["duplicate_stream_ids"].append(
+                {
+                    "ticker": ticker,
+                    "table": "orderbook_snapshots",
+                    "redis_stream_id": row["redis_stream_id"],
+                    "count": row["len"],
+                }
+            )
+        snapshots = snapshots.unique(
+            subset=["redis_stream_id", "side", "price_dollars"], keep="first"
+        )
+
+        negative_snapshots = snapshots.filter(
+            (pl.col("contracts") < 0) & (pl.col("timestamp") >= (start_ts or 0))
+        )
+        for row in negative_snapshots.iter_rows(named=True):
+            issues["negative_contracts"].append(
+                {
+                    "ticker": ticker,
+                    "source": "snapshot",
+                    "redis_stream_id": row["redis_stream_id"],
+                    "timestamp": row["timestamp"],
+                    "side": row["side"],
+                    "price_dollars": str(row["price_dollars"]),
+                    "contracts": row["contracts"],
+                }
+            )
+
+    if not deltas.is_empty():
+        duplicates = (
+            deltas.filter(pl.col("timestamp") >= (start_ts or 0))
+            .group_by("redis_stream_id")
+            .len()
+            .filter(pl.col("len") > 1)
+        )
+        for row in duplicates.iter_rows(named=True):
+            issues["duplicate_stream_ids"].append(
+                {
+                    "ticker": ticker,
+                    "table": "orderbook_deltas",
+                    "redis_stream_id": row["redis_stream_id"],
+                    "count": row["len"],
+                }
+            )
+        deltas = deltas.unique(subset=["redis_stream_id"], keep="first")
+
+    # Build a single ordered list of snapshot and delta messages
+    events = []
+    if not snapshots.is_empty():
+        snapshot_books = snapshots.group_by("redis_stream_id").agg(
+            pl.col("timestamp").first(),
+            pl.col("session_id").first(),
+            pl.col("seq").first(),
+            pl.col("side"),
+            pl.col("price_dollars"),
+            pl.col("contracts"),
+        )
+        for row in snapshot_books.iter_rows(named=True):
+            book = {
+                (side, price_dollars): contracts
+                for side, price_dollars, contracts in zip(
+                    row["side"], row["price_dollars"], row["contracts"]
+                )
+            }
+            key = _order_key(row["timestamp"], row["seq"], row["redis_stream_id"])
+            events.append((key, "snapshot", row, book))
+
+    # Snapshots of an empty book only have a message row
+    if snapshot_messages is not None and not snapshot_messages.is_empty():
+        empty_snapshots = snapshot_messages.filter(pl.col("num_levels") == 0).unique(
+            subset=["redis_stream_id"], keep="first"
+        )
+        for row in empty_snapshots.iter_rows(named=True):
+            key = _order_key(row["timestamp"], row["seq"], row["redis_stream_id"])
+            events.append((key, "snapshot", row, {}))
+
+    for row in deltas.iter_rows(named=True):
+        key = _order_key(row["timestamp"], row["seq"], row["redis_stream_id"])
+        events.append((key, "delta", row, None))
+
+    events.sort(key=lambda event: event[0])
+
+    # Replay deltas between consecutive snapshots of the same session
+    book = None
+    session_id = None
+    for _, msg_type, row, snapshot_book in events:
+        # seq and the book restart with each WebSocket connection
+        if row["session_id"] != session_id:
+            book = None
+            session_id = row["session_id"]
+
+        if msg_type == "snapshot":
+            if (
+                book is not None
+                and book != snapshot_book
+                and in_window(row["timestamp"])
+            ):
+                levels = sorted(
+                    level
+                    for level in book.keys() | snapshot_book.keys()
+                    if book.get(level) != snapshot_book.get(level)
+                )
+                issues["divergences"].append(
+                    {
+                        "ticker": ticker,
+                        "redis_stream_id": row["redis_stream_id"],
+                        "timestamp": row["timestamp"],
+                        "mismatched_levels": len(levels),
+                        "details": "; ".join(
+                            f"{side}@{price_dollars}: replayed "
+                            f"{book.get((side, price_dollars), 0)}, snapshot "
+                            f"{snapshot_book.get((side, price_dollars), 0)}"
+                            for side, price_dollars in levels
+                        ),
+                    }
+                )
+            book = dict(snapshot_book)
+
+        elif book is not None:
+            level = (row["side"], row["price_dollars"])
+            contracts = book.get(level, 0) + row["delta"]
+
+            if contracts < 0 and in_window(row["timestamp"]):
+                issues["negative_contracts"].append(
+                    {
+                        "ticker": ticker,
+                        "source": "replay",
+                        "redis_stream_id": row["redis_stream_id"],
+                        "timestamp": row["timestamp"],
+                        "side": row["side"],
+                        "price_dollars": str(row["price_dollars"]),
+                        "contracts": contracts,
+                    }
+                )
+
+            if contracts > 0:
+                book[level] = contracts
+            else:
+                book.pop(level, None)
+
+    return issues
+
+
+class Validator:
+    def __init__(self, max_workers: int | None = None):
+        self.postgres_client = PostgresClient()
+        self.max_workers = max_workers
+
+    def check(
+        self, tickers: list[str] | None = None, start_ts: int | None = None
+    ) -> dict[str, pl.DataFrame]:
+        """
+        Check stored orderbook data, one ticker per worker process.
+
+        Args:
+            tickers: Tickers to check (default: every ticker with a snapshot)
+            start_ts: Only check rows from this ingestion time (ms) onwards
+
+        Returns:
+            Dict mapping each issue type in ISSUE_TYPES, plus seq_gaps and
+            seq_duplicates, to a DataFrame of issues.
+        """
+        if tickers is None:
+            tickers = self.postgres_client.get_tickers(start_ts)
+
+        issues = {issue_type: [] for issue_type in ISSUE_TYPES}
+
+        with ProcessPoolExecutor(
+            max_workers=self.max_workers, initializer=_init_worker
+        ) as executor:
+            futures = [
+                executor.submit(_check_ticker_worker, ticker, start_ts)
+                for ticker in tickers
+            ]
+            for future in tqdm(
+                as_completed(futures), total=len(futures), desc="Checking tickers"
+            ):
+                for issue_type, rows in future.result().items():
+                    issues[issue_type].extend(rows)
+
+        report = {issue_type: pl.DataFrame(rows) for issue_type, rows in issues.items()}
+
+        # seq is numbered per connection across all tickers, so it is checked
+        # over the whole window rather than per ticker
+        report["seq_gaps"] = self.postgres_client.get_seq_gaps(start_ts)
+        report["seq_duplicates"] = self.postgres_client.get_seq_duplicates(start_ts)
+        return report
+
+    def run(
+        self, sample_size: int = 10, window_ms: int = 3_600_000, interval: float = 60
+    ):
+        """
+        Continuously check a random sample of tickers over a recent window.
+        Each ticker is replayed from its latest snapshot before the window,
+        and every query reads indexed rows from there onwards.
+
+        Args:
+            sample_size: Number of tickers checked per pass (default: 10)
+            window_ms: Size of the checked window in ms (default: 1 hour)
+            interval: Seconds to wait between passes (default: 60)
+        """
+        while True:
+            start_ts = int(time.time() * 1000) - window_ms
+            tickers = self.postgres_client.get_tickers(start_ts)
+            sample = random.sample(tickers, min(sample_size, len(tickers)))
+
+            report = self.check(tickers=sample, start_ts=start_ts)
+            self.print_report(report)
+
+            time.sleep(interval)
+
+    @staticmethod
+    def print_report(report: dict[str, pl.DataFrame]):
+        """Print the number of issues of each type and a preview of each."""
+        for issue_type, issues_df in report.items():
+            print(f"{issue_type}: {issues_df.height}")
+            if issues_df.height > 0:
+                print(issues_df.head(10))
+
+        print(
+            "Note: seq checks only cover rows with a session_id, and snapshots "
+            "of an empty book stored before orderbook_snapshot_messages existed "
+            "are missing, so they can show up as seq gaps or hide divergences."
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check stored orderbook snapshots and deltas for consistency."
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--sample-size",
+        type=int,
+        default=None,
+        help="Continuously check this many random tickers per pass",
+    )
+    parser.add_argument("--window-minutes", type=int, default=60)
+    parser.add_argument("--interval", type=float, default=60)
+    args = parser.parse_args()
+
+    validator = Validator(max_workers=args.workers)
+
+    if args.sample_size is None:
+        validator.print_report(validator.check())
+    else:
+        validator.run(
+            sample_size=args.sample_size,
+            window_ms=args.window_minutes * 60 * 1000,
+            interval=args.interval,
+        )
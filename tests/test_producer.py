@@ -0,0 +1,198 @@
+import asyncio
+
+import producer
+import pytest
+from producer import Producer
+from spill_log import SpillLog
+
+
+class FakeRedisClient:
+    """Records saved messages in memory and fails on demand."""
+
+    def __init__(self):
+        self.stream: list[int] = []
+        self.down = False
+        self.rejected_seqs: set[int] = set()
+        # Seqs that raise a connection error when saved on their own
+        self.failing_seqs: set[int] = set()
+
+    async def save_orderbook_messages(self, messages):
+        if self.down:
+            raise ConnectionError("Redis is down")
+
+        seqs = [message["seq"] for message, _ in messages]
+        if len(messages) > 1 and self.rejected_seqs & set(seqs):
+            raise ValueError("Invalid input")
+        if len(messages) == 1 and seqs[0] in self.failing_seqs:
+            self.failing_seqs.discard(seqs[0])
+            raise ConnectionError("Connection reset")
+        if len(messages) == 1 and seqs[0] in self.rejected_seqs:
+            raise ValueError("Invalid input")
+
+        self.stream.extend(seqs)
+        return [f"0-{seq}" for seq in seqs]
+
+    async def cache_orderbooks(self, books):
+        if self.down:
+            raise ConnectionError("Redis is down")
+
+    async def close(self):
+        pass
+
+
+class FakeKalshiRestClient:
+    def get_tickers(self, series_ticker):
+        return ["TICKER"]
+
+
+class FakeKalshiWSClient:
+    """Yields the messages produced by a test's feed."""
+
+    def __init__(self):
+        self.feed = None
+
+    async def get_order_book_messages(self, market_tickers):
+        async for message in self.feed():
+            yield message
+
+
+def delta(seq: int) -> dict:
+    return {
+        "type": "orderbook_delta",
+        "session_id": "session",
+        "sid": 1,
+        "seq": seq,
+        "msg": {
+            "market_ticker": "TICKER",
+            "side": "yes",
+            "price_dollars": "0.5000",
+            "delta": 1,
+        },
+    }
+
+
+@pytest.fixture
+def redis_client(monkeypatch, tmp_path):
+    client = FakeRedisClient()
+    monkeypatch.setattr(producer, "RedisClient", lambda: client)
+    monkeypatch.setattr(producer, "KalshiRestClient", FakeKalshiRestClient)
+    monkeypatch.setattr(producer, "KalshiWSClient", FakeKalshiWSClient)
+    monkeypatch.setattr(
+        producer,
+        "SpillLog",
+        lambda: SpillLog(str(tmp_path), segment_bytes=4096, max_bytes=65536),
+    )
+
+    # Skip the writer's back-off while Redis is unavailable
+    sleep = asyncio.sleep
+
+    async def fast_sleep(delay, result=None):
+        return await sleep(0, result)
+
+    monkeypatch.setattr(asyncio, "sleep", fast_sleep)
+    return client
+
+
+def run_producer(feed, **kwargs) -> Producer:
+    p = Producer(**kwargs)
+    p.kalshi_ws_client.feed = feed
+    asyncio.run(p.run("SERIES"))
+    return p
+
+
+def spilled_seqs(directory) -> list[int]:
+    log = SpillLog(str(directory), segment_bytes=4096, max_bytes=65536)
+    seqs = []
+    while records := log.read(100):
+        seqs.extend(record["message"]["seq"] for record in records)
+        log.pop(len(records))
+    log.close()
+    return seqs
+
+
+def test_failure_mid_batch(redis_client):
+    # The batch is rejected, so records are written one at a time: seq 2 can
+    # never be saved and Redis drops the connection when seq 4 is written
+    redis_client.rejected_seqs = {2}
+    redis_client.failing_seqs = {4}
+
+    async def feed():
+        for seq in range(8):
+            yield delta(seq)
+        while len(redis_client.stream) < 7:
+            await asyncio.sleep(0)
+
+    run_producer(feed)
+
+    # Only the bad record is dropped and the rest keep their order
+    assert redis_client.stream == [0, 1, 3, 4, 5, 6, 7]
+
+
+def test_spill_then_replay_in_order(redis_client):
+    redis_client.down = True
+
+    async def feed():
+        for seq in range(5):
+            yield delta(seq)
+            await asyncio.sleep(0)
+
+        redis_client.down = False
+        for seq in range(5, 10):
+            yield delta(seq)
+        while len(redis_client.stream) < 10:
+            await asyncio.sleep(0)
+
+    p = run_producer(feed)
+
+    assert redis_client.stream == list(range(10))
+    assert p.spill_log.empty()
+
+
+def test_watermark_spills_queue(redis_client):
+    async def feed():
+        # Nothing is written until the feed yields to the event loop
+        for seq in range(20):
+            yield delta(seq)
+        while len(redis_client.stream) < 20:
+            await asyncio.sleep(0)
+
+    appended = []
+    append = SpillLog.append
+
+    def spy_append(self, record):
+        appended.append(record["message"]["seq"])
+        return append(self, record)
+
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr(SpillLog, "append", spy_append)
+        run_producer(feed, max_queue_size=5, batch_size=4)
+
+    # The first batch leaves more than max_queue_size queued, so it is spilled
+    # along with the rest of the queue and replayed in order
+    assert appended == list(range(20))
+    assert redis_client.stream == list(range(20))
+
+
+def test_drain_on_shutdown(redis_client):
+    async def feed():
+        for seq in range(10):
+            yield delta(seq)
+
+    p = run_producer(feed)
+
+    assert redis_client.stream == list(range(10))
+    assert p._queue.empty()
+
+
+def test_spill_on_shutdown_while_down(redis_client, tmp_path):
+    redis_client.down = True
+
+    async def feed():
+        for seq in range(10):
+            yield delta(seq)
+
+    run_producer(feed)
+
+    # Everything queued at shutdown is kept for the next run
+    assert redis_client.stream == []
+    assert spilled_seqs(tmp_path) == list(range(10))
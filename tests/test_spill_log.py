@@ -0,0 +1,76 @@
+import os
+
+import pytest
+from spill_log import SpillLog
+
+
+def make_log(directory, segment_bytes: int = 256, max_bytes: int = 1024) -> SpillLog:
+    return SpillLog(str(directory), segment_bytes=segment_bytes, max_bytes=max_bytes)
+
+
+def drain(log: SpillLog, batch_size: int = 3) -> list[int]:
+    replayed = []
+    while records := log.read(batch_size):
+        replayed.extend(record["i"] for record in records)
+        log.pop(len(records))
+    return replayed
+
+
+def test_append_and_replay_in_order(tmp_path):
+    log = make_log(tmp_path)
+    assert log.empty()
+
+    for i in range(5):
+        assert log.append({"i": i})
+
+    assert not log.empty()
+    assert [record["i"] for record in log.read(2)] == [0, 1]
+    # read does not consume records
+    assert [record["i"] for record in log.read(2)] == [0, 1]
+    assert drain(log) == [0, 1, 2, 3, 4]
+    assert log.empty()
+    log.close()
+
+
+def test_rotates_segments_and_deletes_replayed_ones(tmp_path):
+    log = make_log(tmp_path)
+
+    num_records = 0
+    while log.append({"i": num_records, "pad": "x" * 20}):
+        num_records += 1
+
+    # Appends stop at the disk budget of max_bytes / segment_bytes segments
+    assert len(os.listdir(tmp_path)) == 4
+    assert drain(log) == list(range(num_records))
+
+    # Only the current write segment is kept once everything is replayed
+    assert len(os.listdir(tmp_path)) == 1
+    assert log.append({"i": num_records})
+    assert drain(log) == [num_records]
+    log.close()
+
+
+def test_reopen_resumes_from_replay_offset(tmp_path):
+    log = make_log(tmp_path)
+    for i in range(20):
+        assert log.append({"i": i, "pad": "x" * 20})
+
+    records = log.read(3)
+    log.pop(len(records))
+    log.close()
+
+    log = make_log(tmp_path)
+    assert log.append({"i": 20})
+    assert drain(log) == list(range(3, 21))
+    log.close()
+
+
+def test_rejects_oversized_record_and_closed_log(tmp_path):
+    log = make_log(tmp_path)
+
+    with pytest.raises(ValueError):
+        log.append({"pad": "x" * 512})
+
+    log.close()
+    with pytest.raises(ValueError):
+        log.append({"i": 0})